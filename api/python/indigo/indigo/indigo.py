@@ -87,15 +87,29 @@ class Indigo:
            format
 
         Args:
-            arr (bytes): array of bytes
+            arr (bytes): array of bytes, bytes-like object or
+                         sequence of ints
 
         Returns:
             IndigoObject: molecule or reaction object
         """
-        values = (c_ubyte * len(arr))()
-        for i in range(len(arr)):
-            values[i] = arr[i]
-        res = self._lib().indigoUnserialize(values, len(arr))
+        if isinstance(arr, (list, tuple)):
+            buf = bytes(arr)
+        else:
+            try:
+                view = memoryview(arr)
+            except TypeError:
+                raise TypeError(
+                    "deserialize() expects bytes-like object or sequence "
+                    f"of ints, got {type(arr).__name__}"
+                ) from None
+            if view.itemsize == 1:
+                buf = view.cast("B")
+            else:
+                # e.g. array("i"), one byte per element
+                buf = bytes(view.tolist())
+        values = (c_ubyte * len(buf)).from_buffer_copy(buf)
+        res = self._lib().indigoUnserialize(values, len(buf))
         return IndigoObject(self, IndigoLib.checkResult(res))
 
     def unserialize(self, arr: bytes) -> IndigoObject:
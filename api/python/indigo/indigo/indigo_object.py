@@ -14,7 +14,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from ctypes import CDLL, POINTER, byref, c_float, c_int, c_ubyte, pointer
+from ctypes import (
+    CDLL,
+    POINTER,
+    byref,
+    c_float,
+    c_int,
+    c_ubyte,
+    pointer,
+    string_at,
+)
 from typing import TYPE_CHECKING, Any, Tuple
 
 from .hybridization import Hybridization
@@ -3599,7 +3608,7 @@ class IndigoObject:
                 self.id, pointer(c_buf), pointer(c_size)
             )
         )
-        return bytes((c_buf[i] for i in range(c_size.value)))  # type: ignore
+        return string_at(c_buf, c_size.value)
 
     def hasProperty(self, prop):
         """Object method returns True if the given property exists
@@ -4219,7 +4228,7 @@ class IndigoObject:
         IndigoLib.checkResult(
             self._lib().indigoToBuffer(self.id, byref(c_buf), byref(c_size))
         )
-        return bytes((c_buf[i] for i in range(c_size.value)))  # type: ignore
+        return string_at(c_buf, c_size.value)
 
     def stereocenterPyramid(self):
         """Atom method returns stereopyramid information
@@ -1,3 +1,5 @@
+from array import array
+
 from tests import TestIndigoBase
 
 
@@ -235,3 +237,14 @@ class TestIndigo(TestIndigoBase):
         self.assertEqual(m_no_rg.countRGroups(), 0)
         m_no_rg.copyRGroups(m_with_rg)
         self.assertEqual(m_no_rg.countRGroups(), 1)
+
+    def test_deserialize_input_types(self) -> None:
+        m = self.indigo.loadMolecule("c1ccccc1O")
+        buf = m.serialize()
+        for arr in (buf, bytearray(buf), list(buf), array("i", buf)):
+            self.assertEqual(
+                self.indigo.deserialize(arr).canonicalSmiles(),
+                m.canonicalSmiles(),
+            )
+        with self.assertRaises(TypeError):
+            self.indigo.deserialize(5)
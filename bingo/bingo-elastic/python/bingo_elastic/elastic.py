@@ -4,6 +4,7 @@ from typing import (
     AsyncGenerator,
     Dict,
     Generator,
+    Iterable,
     List,
     Optional,
     Tuple,
@@ -117,6 +118,8 @@ index_body = {
             "sim_fingerprint_len": {"type": "integer"},
             "sub_fingerprint": {"type": "keyword", "similarity": "boolean"},
             "sub_fingerprint_len": {"type": "integer"},
+            "sim_fingerprint_packed": {"type": "binary"},
+            "sub_fingerprint_packed": {"type": "binary"},
             "cmf": {"type": "binary"},
             "hash": {"type": "unsigned_long"},
             "has_error": {"type": "integer"},
@@ -154,9 +157,13 @@ async def a_create_index(
 
 
 def prepare(
-    records: Generator[IndigoRecord, None, None],
+    records: Iterable[Union[IndigoRecord, Dict]],
 ) -> Generator[Dict, None, None]:
     for record in records:
+        if isinstance(record, dict):
+            # already prepared, e.g. by IndigoRecord.bulk_from_indigo
+            yield record
+            continue
         # if get_index_name(record).value != index_name:
         #     raise ValueError(
         #         f"Index {index_name} doesn't support store value "
@@ -371,6 +378,8 @@ def compile_query(
                 "sim_fingerprint_len",
                 "sub_fingerprint_len",
                 "sub_fingerprint",
+                "sim_fingerprint_packed",
+                "sub_fingerprint_packed",
             ],
         },
     }
@@ -42,8 +42,9 @@ def iterate_file(
 
     indigo_object: IndigoObject
     for indigo_object in getattr(session, iterator_fn)(str(file)):
+        # Iterated objects are not used after, no need to clone them
         yield IndigoRecordMolecule(
-            indigo_object=indigo_object, error_handler=error_handler
+            owned_indigo_object=indigo_object, error_handler=error_handler
         )
 
 
@@ -1,21 +1,142 @@
 from __future__ import annotations
 
-from typing import Callable, Dict, List, Optional
-from uuid import uuid4
+import base64
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
 from indigo import Indigo, IndigoException, IndigoObject  # type: ignore
 
+# Well-known fields of IndigoRecord, stored in slots
+RECORD_FIELDS = (
+    "cmf",
+    "name",
+    "rawData",
+    "sim_fingerprint",
+    "sim_fingerprint_len",
+    "sim_fingerprint_packed",
+    "sub_fingerprint",
+    "sub_fingerprint_len",
+    "sub_fingerprint_packed",
+    "hash",
+    "has_error",
+    "record_id",
+    "error_handler",
+)
+
+# Add system fields here to exclude from indexing
+EXCLUDED_FIELDS = frozenset(
+    {
+        "error_handler",
+        "skip_errors",
+        "fingerprint_kinds",
+        "validate_on_index",
+        "pack_fingerprints",
+    }
+)
+INDEXED_FIELDS = tuple(
+    field for field in RECORD_FIELDS if field not in EXCLUDED_FIELDS
+)
+
+FINGERPRINT_KINDS = ("sim", "sub")
+
+# Keyword arguments accepted by IndigoRecord.bulk_from_indigo
+BULK_OPTIONS = frozenset(
+    {
+        "error_handler",
+        "skip_errors",
+        "take_ownership",
+        "fingerprint_kinds",
+        "validate_on_index",
+        "pack_fingerprints",
+        "workers",
+        "session_factory",
+    }
+)
+
 MOL_TYPES = ["#02: <molecule>", "#03: <query reaction>", "#12: <RDFMolecule>"]
 REAC_TYPES = ["#04: <reaction>", "#05: <query reaction>"]
 
 
+class RecordIdPool:
+    """
+    Generator of random record ids.
+    Random bytes are read from os.urandom in large chunks and sliced,
+    instead of reading 16 bytes for every record like uuid4 does
+    """
+
+    id_size = 16
+
+    def __init__(self, pool_size: int = 1 << 16) -> None:
+        self._pool_size = pool_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Drop buffered random bytes
+        """
+        self._pool = memoryview(b"")
+        self._offset = 0
+
+    def after_fork(self) -> None:
+        """
+        Prepare pool for use in forked child process.
+        The lock could be held by another parent thread at fork time
+        and would never be released in the child, so it is recreated
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def next_id(self) -> str:
+        """
+        Return random 32 characters hex record id
+        """
+        with self._lock:
+            if self._offset + self.id_size > len(self._pool):
+                self._pool = memoryview(os.urandom(self._pool_size))
+                self._offset = 0
+            chunk = self._pool[self._offset : self._offset + self.id_size]
+            self._offset += self.id_size
+        return chunk.hex()
+
+
+_record_ids = RecordIdPool()
+if hasattr(os, "register_at_fork"):
+    # Forked processes must not reuse parent's random bytes
+    os.register_at_fork(after_in_child=_record_ids.after_fork)
+
+
 # pylint: disable=unused-argument
-def skip_errors(instance: IndigoRecord, err: BaseException) -> None:
+def skip_errors(instance: object, err: BaseException) -> None:
     """
     Empty handler to skip errors
     """
 
 
+def get_error_handler(
+    skip: bool,
+    error_handler: Optional[Callable[[object, BaseException], None]],
+) -> Optional[Callable[[object, BaseException], None]]:
+    """
+    Choose error handler from skip_errors and error_handler arguments
+    """
+    if skip:
+        return skip_errors
+    return error_handler
+
+
 def check_error(instance: IndigoRecord, error: BaseException) -> None:
     if instance.error_handler:
         instance.error_handler(instance, error)
@@ -23,78 +144,258 @@ def check_error(instance: IndigoRecord, error: BaseException) -> None:
         raise error
 
 
+def check_fingerprint_kinds(kinds: Iterable[str]) -> Tuple[str, ...]:
+    """
+    Validate fingerprint_kinds option, a bare string like "sim" is
+    rejected instead of being split into characters
+    """
+    if isinstance(kinds, str):
+        raise ValueError(
+            f"fingerprint_kinds must be a sequence of kinds, got {kinds!r}, "
+            f"use ({kinds!r},)"
+        )
+    kinds = tuple(kinds)
+    unknown = set(kinds) - set(FINGERPRINT_KINDS)
+    if unknown:
+        raise ValueError(
+            f"Unknown fingerprint kinds: {', '.join(sorted(unknown))}, "
+            f"expected any of {', '.join(FINGERPRINT_KINDS)}"
+        )
+    return kinds
+
+
+def encode_bytes(buf: bytes) -> str:
+    """
+    Encode binary value (CMF, packed fingerprint) for ES binary field
+    """
+    return base64.b64encode(buf).decode("ascii")
+
+
+def decode_cmf(cmf: str) -> bytes:
+    """
+    Decode CMF stored in record into bytes.
+    CMF is stored as base64 string, records indexed by older versions
+    keep it as space-separated decimal bytes
+    """
+    if " " in cmf:
+        return bytes(map(int, cmf.split(" ")))
+    return base64.b64decode(cmf)
+
+
 class WithElasticResponse:
     def __set__(self, instance: IndigoRecord, value: Dict):
-        el_src = value["_source"]
-        for arg, val in el_src.items():
-            setattr(instance, arg, val)
+        custom_fields = {}
+        for arg, val in value["_source"].items():
+            setter = FIELD_SETTERS.get(arg)
+            if setter:
+                setter(instance, val)
+            else:
+                custom_fields[arg] = val
+        if custom_fields:
+            instance.__dict__.update(custom_fields)
 
 
-class WithIndigoObject:
-    def __set__(  # pylint: disable=too-many-branches
-        self, instance: IndigoRecord, value: IndigoObject
-    ) -> None:
-        try:
-            value_dup = value.clone()
-        except IndigoException as err_:
-            check_error(instance, err_)
-            # Can't create IndigoObject
-            return
-
-        value_dup.aromatize()
-        fingerprints = (
-            "sim",
-            "sub",
+def _hashes(value: IndigoObject) -> Optional[List[int]]:
+    """
+    Hashes of molecule components or hash of reaction,
+    None for other IndigoObject types
+    """
+    internal_type = value.dbgInternalType()
+    if internal_type in MOL_TYPES:
+        if value.countComponents() == 1:
+            # Single component: hash of the whole molecule is the same,
+            # no need to clone the component
+            return [value.hash()]
+        return sorted(
+            {
+                component.clone().hash()
+                for component in value.iterateComponents()
+            }
         )
+    if internal_type in REAC_TYPES:
+        return [value.hash()]
+    return None
 
-        for f_print in fingerprints:
-            try:
-                setattr(instance, f"{f_print}_fingerprint", [])
-                setattr(instance, f"{f_print}_fingerprint_len", 0)
-
-                fp_list = value_dup.fingerprint(f_print).oneBitsList()
-                if fp_list:
-                    fp_ = [int(feature) for feature in fp_list.split(" ")]
-                    setattr(instance, f"{f_print}_fingerprint", fp_)
-                    setattr(instance, f"{f_print}_fingerprint_len", len(fp_))
-            except ValueError as err_:
-                check_error(instance, err_)
-            except IndigoException as err_:
-                check_error(instance, err_)
 
-        try:
-            cmf = " ".join(map(str, list(value_dup.serialize())))
-            setattr(instance, "cmf", cmf)
-        except IndigoException as err_:
-            setattr(instance, "cmf", "")
-            check_error(instance, err_)
+class FieldOptions(NamedTuple):
+    """
+    Options of indigo_object_fields:
+        - copy: if False, value is aromatized in place instead of cloning it
+        - fingerprint_kinds: fingerprints to calculate
+        - validate: if False, valence is not checked and has_error is 0
+        - packed: if True, fingerprint bitsets are added
+          as *_fingerprint_packed
+    """
 
-        try:
-            setattr(instance, "name", value_dup.name())
-        except IndigoException as err_:
-            setattr(instance, "name", "")
-            check_error(instance, err_)
+    copy: bool = True
+    fingerprint_kinds: Tuple[str, ...] = FINGERPRINT_KINDS
+    validate: bool = True
+    packed: bool = False
+
+
+def indigo_object_fields(  # pylint: disable=too-many-branches
+    value: IndigoObject,
+    on_error: Callable[[BaseException], None],
+    options: FieldOptions = FieldOptions(),
+) -> Dict[str, Any]:
+    """
+    Calculate indexed fields (fingerprints, cmf, name, hash, has_error)
+    for IndigoObject. Errors are passed to on_error
+    """
+    fields: Dict[str, Any] = {}
+    try:
+        value_dup = value.clone() if options.copy else value
+    except IndigoException as err_:
+        on_error(err_)
+        # Can't create IndigoObject
+        return fields
+
+    value_dup.aromatize()
 
+    for f_print in options.fingerprint_kinds:
         try:
-            internal_type = value_dup.dbgInternalType()
-            if internal_type in MOL_TYPES:
-                hash_ = [
-                    component.clone().hash()
-                    for component in value_dup.iterateComponents()
-                ]
-                setattr(instance, "hash", sorted(set(hash_)))
-            elif internal_type in REAC_TYPES:
-                setattr(instance, "hash", [value_dup.hash()])
+            fields[f"{f_print}_fingerprint"] = []
+            fields[f"{f_print}_fingerprint_len"] = 0
+
+            fingerprint = value_dup.fingerprint(f_print)
+            if options.packed:
+                fields[f"{f_print}_fingerprint_packed"] = encode_bytes(
+                    fingerprint.toBuffer()
+                )
+            fp_list = fingerprint.oneBitsList()
+            if fp_list:
+                fp_ = list(map(int, fp_list.split(" ")))
+                fields[f"{f_print}_fingerprint"] = fp_
+                fields[f"{f_print}_fingerprint_len"] = len(fp_)
+        except ValueError as err_:
+            on_error(err_)
         except IndigoException as err_:
-            check_error(instance, err_)
+            on_error(err_)
+
+    try:
+        fields["cmf"] = encode_bytes(value_dup.serialize())
+    except IndigoException as err_:
+        fields["cmf"] = ""
+        on_error(err_)
+
+    try:
+        fields["name"] = value_dup.name()
+    except IndigoException as err_:
+        fields["name"] = ""
+        on_error(err_)
+
+    try:
+        hash_ = _hashes(value_dup)
+        if hash_ is not None:
+            fields["hash"] = hash_
+    except IndigoException as err_:
+        on_error(err_)
+
+    if not options.validate:
+        fields["has_error"] = 0
+        return fields
+
+    try:
+        if value_dup.checkBadValence():
+            fields["has_error"] = 1
+        else:
+            fields["has_error"] = 0
+    except IndigoException as err_:
+        on_error(err_)
+
+    return fields
+
 
+def bulk_documents_parallel(
+    indigo_objects: Iterable[IndigoObject],
+    *,
+    error_callback: Callable[[Dict], Callable[[BaseException], None]],
+    options: FieldOptions,
+    workers: int,
+    session_factory: Callable[[], Indigo],
+) -> List[Dict]:
+    """
+    Thread pool implementation of IndigoRecord.bulk_from_indigo.
+    Indigo sessions are not thread-safe, so every IndigoObject is
+    serialized in the calling thread and deserialized into a session
+    owned by the worker thread. Error callbacks of worker documents are
+    called from worker threads. As in serial path, the first error raised
+    (in order of indigo_objects) stops the build: no new objects are
+    submitted and pending ones are cancelled
+    """
+    sessions = threading.local()
+    failed = threading.Event()
+    # Deserialized objects belong to worker thread only, no need to clone
+    worker_options = options._replace(copy=False)
+
+    def build(document: Dict, cmf: bytes, name: str) -> Dict:
+        session = getattr(sessions, "session", None)
+        if session is None:
+            session = sessions.session = session_factory()
+        on_error = error_callback(document)
         try:
-            if value_dup.checkBadValence():
-                setattr(instance, "has_error", 1)
-            else:
-                setattr(instance, "has_error", 0)
-        except IndigoException as err_:
-            check_error(instance, err_)
+            try:
+                value = session.deserialize(cmf)
+            except IndigoException as err_:
+                on_error(err_)
+                return document
+            document.update(
+                indigo_object_fields(value, on_error, worker_options)
+            )
+        except BaseException:
+            failed.set()
+            raise
+        document["name"] = name
+        return document
+
+    futures: List[Future] = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for indigo_object in indigo_objects:
+                if failed.is_set():
+                    break
+                document = {"record_id": _record_ids.next_id()}
+                try:
+                    future = executor.submit(
+                        build,
+                        document,
+                        indigo_object.serialize(),
+                        indigo_object.name(),
+                    )
+                except IndigoException:
+                    # Object can't be moved to worker session, calculate here
+                    document.update(
+                        indigo_object_fields(
+                            indigo_object, error_callback(document), options
+                        )
+                    )
+                    future = Future()
+                    future.set_result(document)
+                futures.append(future)
+            return [future.result() for future in futures]
+        finally:
+            # No-op for finished futures, drops pending ones on failure
+            for future in futures:
+                future.cancel()
+
+
+class WithIndigoObject:
+    def __init__(self, copy: bool = True) -> None:
+        self.copy = copy
+
+    def __set__(self, instance: IndigoRecord, value: IndigoObject) -> None:
+        fields = indigo_object_fields(
+            value,
+            partial(check_error, instance),
+            FieldOptions(
+                copy=self.copy,
+                fingerprint_kinds=instance.fingerprint_kinds,
+                validate=instance.validate_on_index,
+                packed=instance.pack_fingerprints,
+            ),
+        )
+        for arg, val in fields.items():
+            setattr(instance, arg, val)
 
 
 class IndigoRecord:
@@ -106,21 +407,42 @@ class IndigoRecord:
         - IndigoRecordReaction
     """
 
-    cmf: Optional[str] = None
-    name: Optional[str] = None
-    rawData: Optional[str] = None
-    sim_fingerprint: Optional[List[str]] = None
-    sub_fingerprint: Optional[List[str]] = None
+    # Custom fields (e.g. SDF properties) are kept in __dict__
+    __slots__ = RECORD_FIELDS + ("_iob_cache", "__dict__")
+
+    cmf: Optional[str]
+    name: Optional[str]
+    rawData: Optional[str]
+    sim_fingerprint: Optional[List[str]]
+    sim_fingerprint_len: Optional[int]
+    sim_fingerprint_packed: Optional[str]
+    sub_fingerprint: Optional[List[str]]
+    sub_fingerprint_len: Optional[int]
+    sub_fingerprint_packed: Optional[str]
+    hash: Optional[List[int]]
+    has_error: Optional[int]
     indigo_object = WithIndigoObject()
+    owned_indigo_object = WithIndigoObject(copy=False)
     elastic_response = WithElasticResponse()
-    record_id: Optional[str] = None
-    error_handler: Optional[Callable[[object, BaseException], None]] = None
+    record_id: Optional[str]
+    error_handler: Optional[Callable[[object, BaseException], None]]
+    # Fingerprints calculated from IndigoObject
+    fingerprint_kinds: Tuple[str, ...] = FINGERPRINT_KINDS
+    # Set to False in subclasses for trusted sources to skip valence check
+    validate_on_index: bool = True
+    # Store packed fingerprint bitsets, no query uses them yet
+    pack_fingerprints: bool = False
 
     def __init__(self, **kwargs) -> None:
         """
         Constructor accepts only keyword arguments
         :param indigo_object: — create indigo record from IndigoObject
         :type indigo_object: IndigoObject
+        :param owned_indigo_object: — same as indigo_object, but IndigoObject
+                                    is aromatized in place instead of
+                                    being cloned. Use it only for objects
+                                    that are not needed after
+        :type owned_indigo_object: IndigoObject
         :param name: — add name. Rewrites name from IndigoObject
         :type name: str
         :param sim_fingerprint: similarity fingerprint (sim)
@@ -132,40 +454,207 @@ class IndigoRecord:
         :param skip_errors: if True, all errors will be skipped,
                             no error_handler is required
         :type skip_errors: bool
+        :param fingerprint_kinds: fingerprints to calculate, e.g. ("sim",)
+                                  for similarity search queries
+        :type fingerprint_kinds: Tuple[str, ...]
+        :param validate_on_index: if False, valence is not checked and
+                                  has_error is 0
+        :type validate_on_index: bool
+        :param pack_fingerprints: if True, also store fingerprint bitsets
+                                  as base64 in *_fingerprint_packed fields.
+                                  Indices created by older versions map
+                                  these fields dynamically, recreate them
+        :type pack_fingerprints: bool
         """
 
         # First check if skip_errors flag passed
         # If no flag passed add error_handler function from arguments
-        if kwargs.get("skip_errors", False):
-            self.error_handler = skip_errors  # type: ignore
-        else:
-            self.error_handler = kwargs.get("error_handler", None)
+        self.error_handler = get_error_handler(
+            kwargs.get("skip_errors", False), kwargs.get("error_handler", None)
+        )
 
-        self.record_id = uuid4().hex
+        self._iob_cache: Optional[Tuple[Indigo, str, IndigoObject]] = None
+        self.record_id = _record_ids.next_id()
+        # Must be set before indigo_object
+        if "fingerprint_kinds" in kwargs:
+            self.fingerprint_kinds = check_fingerprint_kinds(
+                kwargs.pop("fingerprint_kinds")
+            )
+        if "validate_on_index" in kwargs:
+            self.validate_on_index = bool(kwargs.pop("validate_on_index"))
+        if "pack_fingerprints" in kwargs:
+            self.pack_fingerprints = bool(kwargs.pop("pack_fingerprints"))
         for arg, val in kwargs.items():
             setattr(self, arg, val)
 
+    @classmethod
+    def bulk_from_indigo(
+        cls, indigo_objects: Iterable[IndigoObject], **kwargs
+    ) -> List[Dict]:
+        """
+        Build documents for many IndigoObjects without creating
+        IndigoRecord instances. Result is the same as as_dict for
+        every record and could be passed directly to ES bulk helpers
+        or to ElasticRepository.index_records.
+        Options are accepted only as keyword arguments
+        :param indigo_objects: IndigoObjects to build documents from
+        :type indigo_objects: Iterable[IndigoObject]
+        :param error_handler: lambda for catching exceptions, receives
+                              document (dict) instead of IndigoRecord.
+                              With more than one worker it is called
+                              from worker threads, possibly concurrently
+        :type error_handler: Optional[Callable[[object, BaseException], None]]
+        :param skip_errors: if True, all errors will be skipped,
+                            no error_handler is required
+        :type skip_errors: bool
+        :param take_ownership: if True, IndigoObjects are aromatized in
+                               place instead of being cloned
+        :type take_ownership: bool
+        :param fingerprint_kinds: fingerprints to calculate, defaults to
+                                  fingerprint_kinds of the class
+        :type fingerprint_kinds: Tuple[str, ...]
+        :param validate_on_index: check valence, defaults to
+                                  validate_on_index of the class
+        :type validate_on_index: bool
+        :param pack_fingerprints: store packed fingerprint bitsets,
+                                  defaults to pack_fingerprints of the class
+        :type pack_fingerprints: bool
+        :param workers: number of threads calculating documents,
+                        None means os.cpu_count(). With more than one
+                        worker IndigoObjects are passed to worker threads
+                        as CMF, every thread uses its own Indigo session
+        :type workers: Optional[int]
+        :param session_factory: creates Indigo sessions for worker threads,
+                                required if workers is more than one.
+                                Options of the original session are not
+                                copied, set them here
+        :type session_factory: Callable[[], Indigo]
+        """
+        unknown = kwargs.keys() - BULK_OPTIONS
+        if unknown:
+            raise TypeError(
+                f"Unexpected keyword arguments: {', '.join(sorted(unknown))}"
+            )
+        handler = get_error_handler(
+            kwargs.get("skip_errors", False), kwargs.get("error_handler", None)
+        )
+        workers = kwargs.get("workers", 1)
+
+        def error_callback(document: Dict) -> Callable[[BaseException], None]:
+            def on_error(err_: BaseException) -> None:
+                if handler:
+                    handler(document, err_)
+                else:
+                    raise err_
+
+            return on_error
+
+        options = FieldOptions(
+            copy=not kwargs.get("take_ownership", False),
+            fingerprint_kinds=check_fingerprint_kinds(
+                kwargs.get("fingerprint_kinds", cls.fingerprint_kinds)
+            ),
+            validate=kwargs.get("validate_on_index", cls.validate_on_index),
+            packed=kwargs.get("pack_fingerprints", cls.pack_fingerprints),
+        )
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers > 1:
+            if "session_factory" not in kwargs:
+                raise ValueError(
+                    "session_factory is required if workers > 1, worker "
+                    "sessions must be configured as the caller's session"
+                )
+            return bulk_documents_parallel(
+                indigo_objects,
+                error_callback=error_callback,
+                options=options,
+                workers=workers,
+                session_factory=kwargs["session_factory"],
+            )
+
+        documents: List[Dict] = []
+        for indigo_object in indigo_objects:
+            document = {"record_id": _record_ids.next_id()}
+            document.update(
+                indigo_object_fields(
+                    indigo_object, error_callback(document), options
+                )
+            )
+            documents.append(document)
+        return documents
+
+    def __getattr__(self, name: str) -> Any:
+        # Fields that were never set read as None
+        if name in RECORD_FIELDS:
+            return None
+        raise AttributeError(
+            f"{type(self).__name__!r} object has no attribute {name!r}"
+        )
+
+    def __getstate__(self) -> Tuple[Optional[Dict], Dict]:
+        # Only fields that were set, so copies and unpickled records
+        # keep the same as_dict. Cached IndigoObject is not picklable
+        fields = {}
+        for key in RECORD_FIELDS:
+            try:
+                fields[key] = object.__getattribute__(self, key)
+            except AttributeError:
+                pass
+        return self.__dict__ or None, fields
+
+    def __setstate__(self, state: Tuple[Optional[Dict], Dict]) -> None:
+        custom_fields, fields = state
+        self._iob_cache = None
+        if custom_fields:
+            self.__dict__.update(custom_fields)
+        for key, value in fields.items():
+            FIELD_SETTERS[key](self, value)
+
     def as_dict(self) -> Dict:
-        # Add system fields here to exclude from indexing
-        filtered_fields = {"error_handler", "skip_errors"}
-        return {
-            key: value
-            for key, value in self.__dict__.items()
-            if key not in filtered_fields
-        }
+        result = {}
+        for key in INDEXED_FIELDS:
+            try:
+                result[key] = object.__getattribute__(self, key)
+            except AttributeError:
+                # Field was never set
+                pass
+        custom_fields = self.__dict__
+        for key in custom_fields.keys() - EXCLUDED_FIELDS:
+            result[key] = custom_fields[key]
+        return result
+
+    def as_indigo_object(self, session: Indigo, cached: bool = False):
+        """
+        Deserialize IndigoObject from cmf, new object is returned every call.
+        If cached is True, repeated cached calls with the same session
+        return the same IndigoObject until cmf is changed. The object
+        is shared, so it must not be modified by the caller
+        """
+        if not self.cmf:
+            raise ValueError("Unexpected cmf value")
+        if not cached:
+            return session.deserialize(decode_cmf(self.cmf))  # type: ignore
+        cache = self._iob_cache
+        if cache and cache[0] is session and cache[1] is self.cmf:
+            return cache[2]
+        iob = session.deserialize(decode_cmf(self.cmf))  # type: ignore
+        self._iob_cache = (session, self.cmf, iob)
+        return iob
+
 
-    def as_indigo_object(self, session: Indigo):
-        if self.cmf:
-            return session.deserialize(list(map(int, self.cmf.split(" "))))  # type: ignore
-        raise ValueError("Unexpected cmf value")
+# Slot setters of well-known fields, used to fill records from ES responses
+FIELD_SETTERS: Dict[str, Callable[[IndigoRecord, Any], None]] = {
+    name: getattr(IndigoRecord, name).__set__ for name in RECORD_FIELDS
+}
 
 
 class IndigoRecordMolecule(IndigoRecord):
-    pass
+    __slots__ = ()
 
 
 class IndigoRecordReaction(IndigoRecord):
-    pass
+    __slots__ = ()
 
 
 def as_iob(indigo_record: IndigoRecord, session: Indigo) -> IndigoObject:
@@ -296,7 +296,8 @@ class ExactMatch(CompilableQuery):
             return None
 
         query = record.as_indigo_object(indigo)
-        target = self._target.as_indigo_object(indigo)
+        # Same target for every hit, exactMatch doesn't modify it
+        target = self._target.as_indigo_object(indigo, cached=True)
 
         if indigo.exactMatch(target, query, options):
             return record
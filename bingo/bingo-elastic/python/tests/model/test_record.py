@@ -1,10 +1,21 @@
+import base64
+import copy
+import os
+import pickle
+import signal
 from time import sleep
 
+import pytest
+from indigo import Indigo  # type: ignore
+
 from bingo_elastic.elastic import ElasticRepository
+from bingo_elastic.model import record
 from bingo_elastic.model.record import (
     IndigoRecordMolecule,
     IndigoRecordReaction,
+    RecordIdPool,
     as_iob,
+    decode_cmf,
 )
 from bingo_elastic.queries import SimilarityMatch
 
@@ -14,7 +25,7 @@ def test_empty_create(indigo_fixture):
     mol_record = IndigoRecordMolecule(indigo_object=mol)
     assert len(mol_record.sub_fingerprint) == 0
     assert len(mol_record.sim_fingerprint) == 0
-    assert len(mol_record.cmf.split()) == 5
+    assert len(base64.b64decode(mol_record.cmf)) == 5
 
 
 def test_create(indigo_fixture):
@@ -23,7 +34,232 @@ def test_create(indigo_fixture):
     indigo_record = IndigoRecordMolecule(indigo_object=mol)
     assert len(indigo_record.sim_fingerprint) == 56
     assert len(indigo_record.sub_fingerprint) == 615
-    assert len(indigo_record.cmf.split()) == 48
+    assert "sim_fingerprint_packed" not in indigo_record.as_dict()
+    assert len(base64.b64decode(indigo_record.cmf)) == 48
+
+
+def test_create_packed(indigo_fixture):
+    mol = indigo_fixture.loadMolecule("N1(CC)C2=C(C(=NC=N2)N)N=C1")
+    indigo_record = IndigoRecordMolecule(
+        indigo_object=mol, pack_fingerprints=True
+    )
+    for packed, bits in (
+        (indigo_record.sim_fingerprint_packed, 56),
+        (indigo_record.sub_fingerprint_packed, 615),
+    ):
+        buf = base64.b64decode(packed)
+        assert sum(bin(byte).count("1") for byte in buf) == bits
+    assert "pack_fingerprints" not in indigo_record.as_dict()
+
+
+def test_legacy_cmf(indigo_fixture):
+    mol = indigo_fixture.loadMolecule("N1(CC)C2=C(C(=NC=N2)N)N=C1")
+    indigo_record = IndigoRecordMolecule(indigo_object=mol)
+    cmf = decode_cmf(indigo_record.cmf)
+    indigo_record.cmf = " ".join(map(str, cmf))
+    assert decode_cmf(indigo_record.cmf) == cmf
+    assert (
+        as_iob(indigo_record, indigo_fixture).canonicalSmiles()
+        == indigo_fixture.deserialize(cmf).canonicalSmiles()
+    )
+
+
+def test_bulk_from_indigo(indigo_fixture):
+    smiles = ["N1(CC)C2=C(C(=NC=N2)N)N=C1", "c1ccccc1", "[H][H]"]
+    mols = [indigo_fixture.loadMolecule(smile) for smile in smiles]
+    documents = IndigoRecordMolecule.bulk_from_indigo(mols, skip_errors=True)
+    assert len(documents) == len(mols)
+    assert len({document["record_id"] for document in documents}) == 3
+    for mol, document in zip(mols, documents):
+        expected = IndigoRecordMolecule(
+            indigo_object=mol, skip_errors=True
+        ).as_dict()
+        assert len(document["record_id"]) == 32
+        del expected["record_id"], document["record_id"]
+        assert document == expected
+
+
+def test_bulk_from_indigo_unknown_option(indigo_fixture):
+    mol = indigo_fixture.loadMolecule("c1ccccc1")
+    with pytest.raises(TypeError):
+        IndigoRecordMolecule.bulk_from_indigo([mol], skip_error=True)
+
+
+def test_bulk_from_indigo_parallel(indigo_fixture, resource_loader):
+    mols = list(
+        indigo_fixture.iterateSDFile(
+            resource_loader("molecules/rand_queries_small.sdf")
+        )
+    )
+    expected = IndigoRecordMolecule.bulk_from_indigo(mols, skip_errors=True)
+    with pytest.raises(ValueError):
+        IndigoRecordMolecule.bulk_from_indigo(mols, workers=4)
+    documents = IndigoRecordMolecule.bulk_from_indigo(
+        mols, skip_errors=True, workers=4, session_factory=Indigo
+    )
+    assert len(documents) == len(expected)
+    for document, expected_document in zip(documents, expected):
+        del document["record_id"], expected_document["record_id"]
+        assert document == expected_document
+    failing = mols + [indigo_fixture.loadMolecule("[H][H]")] + mols
+    with pytest.raises(Exception) as serial_error:
+        IndigoRecordMolecule.bulk_from_indigo(failing)
+    with pytest.raises(serial_error.type):
+        IndigoRecordMolecule.bulk_from_indigo(
+            failing, workers=4, session_factory=Indigo
+        )
+
+
+def test_create_owned(indigo_fixture):
+    smile = "N1(CC)C2=C(C(=NC=N2)N)N=C1"
+    expected = IndigoRecordMolecule(
+        indigo_object=indigo_fixture.loadMolecule(smile)
+    ).as_dict()
+    owned = IndigoRecordMolecule(
+        owned_indigo_object=indigo_fixture.loadMolecule(smile)
+    ).as_dict()
+    del expected["record_id"], owned["record_id"]
+    assert owned == expected
+
+
+def test_record_id_pool():
+    pool = RecordIdPool(pool_size=3 * RecordIdPool.id_size)
+    record_ids = [pool.next_id() for _ in range(10)]
+    assert len(set(record_ids)) == 10
+    assert all(len(record_id) == 32 for record_id in record_ids)
+
+
+def test_as_indigo_object_cached(indigo_fixture):
+    mol = indigo_fixture.loadMolecule("N1(CC)C2=C(C(=NC=N2)N)N=C1")
+    indigo_record = IndigoRecordMolecule(indigo_object=mol)
+    iob = indigo_record.as_indigo_object(indigo_fixture, cached=True)
+    assert indigo_record.as_indigo_object(indigo_fixture, cached=True) is iob
+    assert as_iob(indigo_record, indigo_fixture) is not iob
+    assert indigo_record.as_indigo_object(Indigo(), cached=True) is not iob
+    pickle.dumps(indigo_record)
+    indigo_record.cmf = IndigoRecordMolecule(
+        indigo_object=indigo_fixture.loadMolecule("c1ccccc1")
+    ).cmf
+    assert (
+        indigo_record.as_indigo_object(
+            indigo_fixture, cached=True
+        ).canonicalSmiles()
+        == "c1ccccc1"
+    )
+
+
+def test_create_sim_only(indigo_fixture):
+    mol = indigo_fixture.loadMolecule("N1(CC)C2=C(C(=NC=N2)N)N=C1")
+    indigo_record = IndigoRecordMolecule(
+        indigo_object=mol, fingerprint_kinds=("sim",)
+    )
+    assert len(indigo_record.sim_fingerprint) == 56
+    assert indigo_record.sub_fingerprint is None
+    assert "sub_fingerprint" not in indigo_record.as_dict()
+    assert "fingerprint_kinds" not in indigo_record.as_dict()
+
+
+def test_invalid_fingerprint_kinds(indigo_fixture):
+    mol = indigo_fixture.loadMolecule("c1ccccc1")
+    for fingerprint_kinds in ("sim", ("sim", "similarity")):
+        with pytest.raises(ValueError):
+            IndigoRecordMolecule(
+                indigo_object=mol, fingerprint_kinds=fingerprint_kinds
+            )
+        with pytest.raises(ValueError):
+            IndigoRecordMolecule.bulk_from_indigo(
+                [mol], fingerprint_kinds=fingerprint_kinds
+            )
+
+
+def test_create_without_validation(indigo_fixture):
+    class TrustedRecord(IndigoRecordMolecule):
+        __slots__ = ()
+        validate_on_index = False
+
+    smile = "C(C)(C)(C)(C)C"
+    mol = indigo_fixture.loadMolecule(smile)
+    assert IndigoRecordMolecule(indigo_object=mol).has_error == 1
+    assert TrustedRecord(indigo_object=mol).has_error == 0
+    unchecked = IndigoRecordMolecule(
+        indigo_object=mol, validate_on_index=False
+    )
+    assert unchecked.has_error == 0
+    assert "validate_on_index" not in unchecked.as_dict()
+    (document,) = IndigoRecordMolecule.bulk_from_indigo(
+        [mol], validate_on_index=False
+    )
+    assert document["has_error"] == 0
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_record_id_pool_fork_with_held_lock():
+    # pylint: disable=protected-access
+    with record._record_ids._lock:
+        pid = os.fork()
+        if pid == 0:
+            # Child is killed by SIGALRM if next_id deadlocks
+            signal.alarm(5)
+            code = 1
+            try:
+                IndigoRecordMolecule()
+                code = 0
+            finally:
+                os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+
+def test_single_component_hash(indigo_fixture, resource_loader):
+    mols = [
+        indigo_fixture.loadMolecule(smile)
+        for smile in (
+            "N1(CC)C2=C(C(=NC=N2)N)N=C1",
+            "c1ccccc1",
+            "C[C@H](N)C(=O)O",
+            "[NH4+]",
+        )
+    ]
+    mols += list(
+        indigo_fixture.iterateSDFile(
+            resource_loader("molecules/rand_queries_small.sdf")
+        )
+    )
+    mols.append(
+        indigo_fixture.loadMoleculeFromFile(
+            resource_loader("molecules/composition1.mol")
+        )
+    )
+    checked = 0
+    for mol in mols:
+        if mol.countComponents() != 1:
+            continue
+        for value in (mol.clone(), mol):
+            value.aromatize()
+            component_hash = [
+                component.clone().hash()
+                for component in value.iterateComponents()
+            ]
+            assert [value.hash()] == component_hash
+        assert IndigoRecordMolecule(indigo_object=mol).hash == component_hash
+        checked += 1
+    assert checked > 4
+
+
+def test_copy_and_pickle(indigo_fixture):
+    mol = indigo_fixture.loadMolecule("N1(CC)C2=C(C(=NC=N2)N)N=C1")
+    indigo_record = IndigoRecordMolecule(
+        indigo_object=mol,
+        fingerprint_kinds=("sim",),
+        PUBCHEM_IUPAC_INCHIKEY="RDHQFKQIGNGIED-UHFFFAOYSA-N",
+    )
+    expected = indigo_record.as_dict()
+    for duplicate in (
+        copy.copy(indigo_record),
+        pickle.loads(pickle.dumps(indigo_record)),
+    ):
+        assert duplicate.as_dict() == expected
+        assert "sub_fingerprint" not in duplicate.as_dict()
 
 
 def test_create_without_fingerprint(indigo_fixture):